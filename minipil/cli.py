@@ -1,16 +1,18 @@
 # minipil/cli.py (top)
+import json
 import typer
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 
 from minipil.session import SESSION
 from minipil.parser import parse_nl
 from minipil.core import (
     resize_preserve_aspect, crop_to_ratio, pad_to_size,
-    to_grayscale, save_image_bytes,
-    # new effect functions — make sure these exist in minipil/core.py
-    invert_image, blur_image, sharpen_image,
-    adjust_brightness, adjust_contrast, adjust_saturation,
-    rotate_image, flip_horizontal, flip_vertical,
+    to_grayscale, save_image_bytes, apply_history,
+    history_orientation, save_jpeg_reoriented, probe_image, leading_resize, ENCODER_PROFILES, encoder_options,
+    # multi-frame streaming
+    MULTIFRAME_FORMATS, frame_format, iter_frames, process_frames, save_frames,
 )
 
 
@@ -26,12 +28,35 @@ def connect(path: Path):
         raise typer.Exit(code=1)
 
     try:
-        img = SESSION.connect(path)   # loads image and persists session
+        info = SESSION.connect(path)   # reads header only and persists session
     except Exception as e:
         typer.echo(f"Failed to connect: {e}")
         raise typer.Exit(code=1)
 
-    typer.echo(f"Connected to: {path.name} ({img.size[0]}x{img.size[1]}, format={SESSION.format})")
+    frames = f", frames={info['frames']}" if info["frames"] > 1 else ""
+    typer.echo(f"Connected to: {path.name} ({info['width']}x{info['height']}, format={SESSION.format}{frames})")
+
+
+@app.command()
+def info(files: List[Path] = typer.Argument(..., help="Image files to inspect"),
+         workers: int = typer.Option(8, "--workers", help="Files probed concurrently")):
+    """
+    Print one JSON line per file with dimensions (after EXIF orientation), mode,
+    format, frame count and file size. Reads headers only; exits 1 if any file fails.
+    """
+    def probe(p: Path):
+        try:
+            return probe_image(p)
+        except Exception as e:
+            return {"path": str(p), "error": str(e)}
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for result in pool.map(probe, files):
+            failed = failed or "error" in result
+            typer.echo(json.dumps(result))
+    if failed:
+        raise typer.Exit(code=1)
 
 
 @app.command(name="do")
@@ -44,6 +69,13 @@ def do(text: str = typer.Argument(..., help='Natural language instruction, e.g.
         raise typer.Exit(code=1)
 
     actions = parse_nl(text)
+    if actions.get("profile") and actions.get("format"):
+        # e.g. "lossless jpg": reject before it lands in the history
+        try:
+            encoder_options(actions["format"], actions["profile"])
+        except ValueError as e:
+            typer.echo(str(e))
+            raise typer.Exit(code=1)
     img = SESSION.img
 
     # 1) crop to ratio
@@ -101,75 +133,48 @@ def do(text: str = typer.Argument(..., help='Natural language instruction, e.g.
 
 
 @app.command()
-def save(out: str = typer.Argument(None, help="Output filename (defaults to minipil.png)")):
+def save(out: str = typer.Argument(None, help="Output filename (defaults to minipil.png)"),
+         ssim: float = typer.Option(None, "--ssim", help="Lowest quality whose SSIM is at least this, e.g. 0.95"),
+         psnr: float = typer.Option(None, "--psnr", help="Lowest quality whose PSNR (dB) is at least this, e.g. 40"),
+         workers: int = typer.Option(1, "--workers", help="Threads for processing frames of animated/multi-page inputs"),
+         profile: str = typer.Option(None, "--profile", help="Encoder profile: fast, balanced (default), smallest or lossless")):
     """
     Save the currently edited image. Re-load the original file and replay the full
     actions history (SESSION._actions_history) in order, then write output.
+    Animated GIF/WebP and multi-page TIFF inputs are streamed frame by frame when
+    the output format can hold frames.
     """
     if not SESSION.path:
         typer.echo("No image connected. Nothing to save.")
         raise typer.Exit(code=1)
 
-    # Load base image from disk (do NOT rely on in-memory SESSION.img which may be stale)
-    try:
-        base_img = SESSION.load_image()
-    except Exception as e:
-        typer.echo(f"Failed to open connected image: {e}")
-        raise typer.Exit(code=1)
-
-    # Replay full history
     history = getattr(SESSION, "_actions_history", []) or []
-    img = base_img
-
-    for actions in history:
-        # crop/resize order same as do()
-        if "ratio" in actions:
-            a, b = actions["ratio"]
-            img = crop_to_ratio(img, a, b)
-
-        if "pixels" in actions:
-            w, h = actions["pixels"]
-            img = resize_preserve_aspect(img, target_w=w, target_h=h)
-        elif "resize_w" in actions or "resize_h" in actions:
-            w = actions.get("resize_w")
-            h = actions.get("resize_h")
-            img = resize_preserve_aspect(img, target_w=w, target_h=h)
-
-        if actions.get("bnw"):
-            img = to_grayscale(img)
-
-        # additional effects
-        if actions.get("invert"):
-            img = invert_image(img)
-        if "blur" in actions:
-            img = blur_image(img, radius=float(actions.get("blur", 2.0)))
-        if "sharpen" in actions:
-            sval = actions.get("sharpen")
-            if isinstance(sval, bool):
-                img = sharpen_image(img)
-            else:
-                img = sharpen_image(img, radius=float(sval))
-        if "brightness" in actions:
-            img = adjust_brightness(img, float(actions["brightness"]))
-        if "contrast" in actions:
-            img = adjust_contrast(img, float(actions["contrast"]))
-        if "saturation" in actions:
-            img = adjust_saturation(img, float(actions["saturation"]))
-        if "rotate" in actions:
-            img = rotate_image(img, float(actions["rotate"]), expand=True)
-        if actions.get("flip_h"):
-            img = flip_horizontal(img)
-        if actions.get("flip_v"):
-            img = flip_vertical(img)
 
     # Determine final format/target_bytes: last action that specifies them wins
     fmt = None
     target_bytes = None
+    target_quality = None
+    encoder_profile = None
     for a in history:
         if a.get("format"):
             fmt = a.get("format")
         if a.get("target_bytes"):
             target_bytes = a.get("target_bytes")
+        if a.get("target_quality"):
+            target_quality = tuple(a.get("target_quality"))
+        if a.get("profile"):
+            encoder_profile = a.get("profile")
+
+    # CLI options override history
+    if profile:
+        encoder_profile = profile.lower()
+    if encoder_profile not in (None, *ENCODER_PROFILES):
+        typer.echo(f"Unknown profile: {encoder_profile} (choose from {', '.join(ENCODER_PROFILES)})")
+        raise typer.Exit(code=1)
+    if ssim is not None:
+        target_quality = ("ssim", ssim)
+    elif psnr is not None:
+        target_quality = ("psnr", psnr)
 
     # allow CLI out argument to override format
     outname = out or "minipil.png"
@@ -178,8 +183,61 @@ def save(out: str = typer.Argument(None, help="Output filename (defaults to mini
     if "." not in outname and fmt:
         outname = outname + "." + fmt
 
+    # Multi-frame inputs: replay history per frame and write progressively.
+    # Size/quality targets search a single encode, so they keep the first-frame path.
+    try:
+        src = probe_image(SESSION.path)
+    except Exception as e:
+        typer.echo(f"Failed to open connected image: {e}")
+        raise typer.Exit(code=1)
+    n_frames = src["frames"]
+
+    if n_frames > 1 and frame_format(fmt) in MULTIFRAME_FORMATS and not (target_bytes or target_quality):
+        try:
+            frames = process_frames(iter_frames(SESSION.path), history, workers=workers)
+            size = save_frames(frames, outname, fmt=fmt, profile=encoder_profile)
+        except Exception as e:
+            typer.echo(f"Save failed: {e}")
+            raise typer.Exit(code=1)
+        typer.echo(f"Saved -> {outname} ({size} bytes, {n_frames} frames)")
+        return
+    if n_frames > 1:
+        reason = "target set" if (target_bytes or target_quality) else f"{frame_format(fmt)} holds one frame"
+        typer.echo(f"Warning: {reason}: writing first frame only ({n_frames} frames in input)")
+
+    # Empty or orientation-only history, JPEG in and out: copy bytes and rewrite
+    # the EXIF orientation instead of decoding and re-encoding. Decided by the
+    # decoded header, not the suffix (MPO or a renamed PNG take the normal path).
+    orientation = history_orientation(history)
+    if (orientation is not None and frame_format(fmt) == "JPEG" and src["format"] == "JPEG"
+            and not (target_bytes or target_quality)):
+        try:
+            size = save_jpeg_reoriented(SESSION.path, outname, orientation)
+        except Exception as e:
+            typer.echo(f"Save failed: {e}")
+            raise typer.Exit(code=1)
+        typer.echo(f"Saved -> {outname} ({size} bytes, lossless)")
+        return
+
+    # Load base image from disk (do NOT rely on in-memory SESSION.img which may be stale).
+    # A history that starts by resizing can begin from a cached pyramid level.
+    try:
+        size = (src["width"], src["height"])
+        target, history = leading_resize(history, size)
+        if target:
+            base_img = SESSION.load_pyramid_level(target, size)
+        else:
+            base_img = SESSION.load_image()
+    except Exception as e:
+        typer.echo(f"Failed to open connected image: {e}")
+        raise typer.Exit(code=1)
+
+    # Replay full history
+    img = apply_history(base_img, history)
+
     try:
-        size = save_image_bytes(img, outname, fmt=fmt, target_bytes=target_bytes)
+        size = save_image_bytes(img, outname, fmt=fmt, target_bytes=target_bytes, target_quality=target_quality,
+                                profile=encoder_profile)
     except Exception as e:
         typer.echo(f"Save failed: {e}")
         raise typer.Exit(code=1)
@@ -191,7 +249,7 @@ def save(out: str = typer.Argument(None, help="Output filename (defaults to mini
 @app.command("clear-session")
 def clear_session():
     """
-    Clear persisted session (remove saved connected path).
+    Clear persisted session (remove saved connected path and cached pyramids).
     """
     SESSION.clear()
     typer.echo("Session cleared.")
@@ -31,7 +31,7 @@ def _norm(text: str) -> str:
 def parse_nl(text: str) -> Dict[str, Any]:
     """
     Rule-based NL parser. Returns dict with keys:
-    pixels, ratio, target_bytes, format, bnw, resize_w, resize_h,
+    pixels, ratio, target_bytes, target_quality, profile, format, bnw, resize_w, resize_h,
     invert, blur, sharpen, brightness, contrast, saturation, rotate, flip_h, flip_v
     """
     t = _norm(text or "")
@@ -131,6 +131,29 @@ def parse_nl(text: str) -> Dict[str, Any]:
             actions["flip_v"] = True
             continue
 
+        # ----- perceptual quality target (e.g., "quality ssim 0.95", "psnr 40")
+        # must run before size parsing, which would read "0.95" as a bare KB size
+        m = re.search(r"\b(?:quality\s+)?(ssim|psnr)\b\s*(?:of|to|at least|>=|=|:)?\s*(\d+(?:\.\d+)?)", clause)
+        if m:
+            metric, val = m.group(1), float(m.group(2))
+            # allow "ssim 95" as shorthand for 0.95
+            if metric == "ssim" and val > 1:
+                val = val / 100.0
+            actions["target_quality"] = (metric, val)
+            continue
+
+        # ----- encoder profile (e.g., "profile smallest", "fast encode", "lossless webp")
+        # no "file"/"save" forms: "smallest file size 200kb" is a size target.
+        # The clause still goes through the rules below, so a size in it is kept.
+        m = re.search(r"\b(?:profile|preset|encoder|encode|encoding)\s*(?:is|=|:|to)?\s*(fast|balanced|smallest|lossless)\b", clause) \
+            or re.search(r"\b(fast|balanced|smallest|lossless)\s+(?:profile|preset|encode|encoding|webp|png|jpeg|jpg)\b", clause)
+        if m:
+            actions["profile"] = m.group(1)
+            # "lossless webp" also names the output format
+            fm = re.search(r"\b(png|jpeg|jpg|webp)\b", clause)
+            if fm:
+                actions["format"] = fm.group(1).lower()
+
         # ----- pixels exact (e.g., "400x600" or "resize to 400x600")
         m = re.search(r"\b(\d{2,5})\s*[x×\*]\s*(\d{2,5})\b", clause)
         if m:
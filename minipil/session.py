@@ -1,13 +1,49 @@
 # minipil/session.py
 from pathlib import Path
 from PIL import Image, ImageOps
+import hashlib
 import json
 import os
+import shutil
+import tempfile
 from typing import Optional, List, Dict, Any
 
+from minipil.core import probe_image, pick_pyramid_level, pyramid_level_sizes, build_pyramid
+
 # Session file location
 _SESSION_DIR = Path.home() / ".minipil"
 _SESSION_FILE = _SESSION_DIR / "session.json"
+# Resolution pyramids, one folder per source content hash
+_PYRAMID_DIR = _SESSION_DIR / "pyramid"
+# Least recently used pyramids are evicted once the cache grows past this
+_PYRAMID_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _content_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _evict_pyramids(keep: Path):
+    """
+    Delete least recently used pyramid folders (by folder mtime) until the cache
+    fits in _PYRAMID_MAX_BYTES. The folder in use (keep) is never evicted.
+    """
+    entries = []
+    for d in _PYRAMID_DIR.iterdir():
+        if d.is_dir():
+            size = sum(f.stat().st_size for f in d.iterdir() if f.is_file())
+            entries.append((d.stat().st_mtime, size, d))
+    total = sum(size for _, size, _ in entries)
+    for _, size, d in sorted(entries):
+        if total <= _PYRAMID_MAX_BYTES:
+            break
+        if d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
 
 
 class Session:
@@ -76,22 +112,87 @@ class Session:
         self.format = img.format or (self.path.suffix.replace(".", "").upper() or "PNG")
         return img
 
+    def load_pyramid_level(self, target, size=None):
+        """
+        Open the connected image at the smallest pyramid level suited to a resize
+        to target (w, h), instead of decoding the full-resolution master.
+        size is the master's (w, h) after EXIF orientation, if the caller already
+        probed it; otherwise the header is read here.
+        Levels are cached under ~/.minipil/pyramid/<sha256>/ and all of them are
+        built the first time the master has to be decoded; least recently used
+        pyramids are evicted past _PYRAMID_MAX_BYTES.
+        """
+        if not self.path:
+            raise FileNotFoundError("No session path set")
+        if size is None:
+            info = probe_image(self.path)
+            size = (info["width"], info["height"])
+        level = pick_pyramid_level(size, target)
+        if level == 0:
+            return self.load_image()
+
+        cache_dir = _PYRAMID_DIR / _content_hash(self.path)
+        cached = cache_dir / f"{level}.png"
+        if cached.exists():
+            try:
+                with Image.open(cached) as im:
+                    img = im.convert("RGB")
+                if img.size == pyramid_level_sizes(size)[level]:
+                    try:
+                        os.utime(cache_dir)  # mark recently used for eviction
+                    except OSError:
+                        pass
+                    return img
+            except Exception:
+                # unreadable cache entry: rebuild below
+                pass
+
+        chosen = None
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        except Exception:
+            pass
+        for n, img in enumerate(build_pyramid(self.load_image()), start=1):
+            try:
+                # write to a uniquely named file, then rename, so concurrent
+                # builders never share a temp file and readers never see a partial one
+                with tempfile.NamedTemporaryFile(dir=cache_dir, suffix=".png.tmp", delete=False) as tmp:
+                    img.save(tmp, format="PNG", compress_level=1)
+                os.replace(tmp.name, cache_dir / f"{n}.png")
+            except Exception:
+                # caching is best effort; the resize still proceeds
+                try:
+                    os.unlink(tmp.name)
+                except Exception:
+                    pass
+            if n == level:
+                chosen = img
+        try:
+            _evict_pyramids(keep=cache_dir)
+        except Exception:
+            pass
+        return chosen
+
     def connect(self, path: Path):
         """
         Connect to a new image and persist session to disk.
         Path can be relative; it will be stored as absolute path.
         Connecting to a new image resets the action history by design.
+        Only the header is read here; pixels are decoded lazily by load_image().
+        Returns the probe_image() dict (dimensions after orientation, format, ...).
         """
         p = Path(path).resolve()
         if not p.exists():
             raise FileNotFoundError(f"File not found: {p}")
+        # read header now so CLI can show details immediately (raises if not an image)
+        info = probe_image(p)
         self.path = p
+        self.img = None
+        self.format = info["format"]
         # Reset history when connecting to a new image
         self._actions_history = []
-        # load image now so CLI can show details immediately
-        self.load_image()
         self._save_to_disk()
-        return self.img
+        return info
 
     def is_connected(self) -> bool:
         """
@@ -110,7 +211,7 @@ class Session:
 
     def clear(self):
         """
-        Clear session both in memory and on disk.
+        Clear session both in memory and on disk, including cached pyramids.
         """
         self.path = None
         self.img = None
@@ -121,6 +222,7 @@ class Session:
                 _SESSION_FILE.unlink()
         except Exception:
             pass
+        shutil.rmtree(_PYRAMID_DIR, ignore_errors=True)
 
 
 # a single shared Session instance imported by your CLI modules
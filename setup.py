@@ -6,7 +6,9 @@ setup(
     packages=find_packages(),
     install_requires=[
         "typer[all]",
-        "Pillow"
+        # the streaming WebP writer matches the Pillow 11 encoder API;
+        # older Pillow falls back to save_all
+        "Pillow>=11.0"
     ],
     entry_points={
         "console_scripts": [
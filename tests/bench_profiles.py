@@ -0,0 +1,37 @@
+# bench_profiles.py
+# Encode time vs. output bytes for every encoder profile and format.
+# Run from the repo root: python -m tests.bench_profiles [width height]
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from minipil.core import ENCODER_PROFILES, save_image_bytes
+
+from .golden import photo
+
+w, h = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) == 3 else (1600, 1200)
+img = photo(w, h)
+
+cases = [
+    ("PNG", {}),
+    ("JPEG", {}),
+    ("WEBP", {}),
+    ("JPEG", {"target_bytes": 100 * 1024}),
+    ("WEBP", {"target_bytes": 100 * 1024}),
+    ("JPEG", {"target_quality": ("ssim", 0.95)}),
+]
+
+print(f"input: {w}x{h} RGB")
+print(f"{'format':<6} {'target':<14} {'profile':<10} {'bytes':>10} {'ms':>9}")
+with tempfile.TemporaryDirectory() as tmp:
+    for fmt, target in cases:
+        label = " ".join(str(x) for v in target.values() for x in (v if isinstance(v, tuple) else (v,))) or "-"
+        for profile in ENCODER_PROFILES:
+            if profile == "lossless" and fmt == "JPEG":
+                continue  # JPEG has no lossless mode
+            out = Path(tmp) / f"out.{fmt.lower()}"
+            t0 = time.perf_counter()
+            size = save_image_bytes(img, str(out), fmt=fmt, profile=profile, **target)
+            ms = (time.perf_counter() - t0) * 1000
+            print(f"{fmt:<6} {label:<14} {profile:<10} {size:>10} {ms:>9.1f}")
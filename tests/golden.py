@@ -0,0 +1,344 @@
+# golden.py
+# Golden-image correctness + timing harness for the connect/do/save pipeline.
+#
+# Every case builds deterministic synthetic inputs, drives the real CLI
+# (connect, one `do` per instruction string, save) against a throwaway
+# session directory, then checks the output:
+#   - "exact" cases: sha256 of the decoded, EXIF-oriented pixels (every frame,
+#     plus its duration) must match tests/golden_hashes.json;
+#   - lossy cases: every frame must be within a PSNR tolerance of a lossless
+#     reference run of the same edits, and under the byte target if one is set.
+#
+# Run from the repo root:
+#   python -m tests.golden                    # check all cases, print timings
+#   python -m tests.golden --update           # re-record golden hashes
+#   python -m tests.golden --timings out.jsonl
+import argparse
+import hashlib
+import json
+import math
+import random
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import PIL
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageOps
+from typer.testing import CliRunner
+
+from minipil import session
+from minipil.cli import app
+from minipil.core import apply_history
+from minipil.parser import parse_nl
+
+GOLDEN_FILE = Path(__file__).with_name("golden_hashes.json")
+
+# (name, input, instructions passed to `do` one by one, output file, extra save args, check)
+# check is "exact" or {"psnr": min dB, "reference": instructions for a lossless run}.
+# PSNR here is over RGB, so it sits below the luma PSNR that --psnr targets.
+# "resave" saves a second time from the cached pyramid and requires identical pixels.
+# "direct_psnr" requires that PSNR against the same edits on the full-resolution input.
+# "same_scan" requires the JPEG's entropy-coded data to be copied from the input unchanged.
+CASES = [
+    {"name": "bnw", "input": "photo.png", "do": ["convert to bnw"], "out": "out.png", "check": "exact"},
+    {"name": "ratio_resize", "input": "photo.png", "do": ["ratio 4:5", "resize to 200x250"],
+     "out": "out.png", "check": "exact"},
+    {"name": "effects_chain", "input": "photo.png",
+     "do": ["invert and blur 3 and rotate 90", "brightness +20% and sharpen 2"], "out": "out.png", "check": "exact"},
+    {"name": "arbitrary_rotate", "input": "photo.png", "do": ["rotate 45", "saturation +40%"],
+     "out": "out.png", "check": "exact"},
+    {"name": "orientation_fold", "input": "photo.png", "do": ["rotate 90", "flip horizontal", "rotate 180 and flip v"],
+     "out": "out.png", "check": "exact"},
+    {"name": "orientation_fold_mirrored", "input": "photo.png", "do": ["flip horizontal", "rotate 90"],
+     "out": "out.png", "check": "exact"},
+    {"name": "pyramid_resize", "input": "large.png", "do": ["width 200 and contrast +10%"],
+     "out": "out.png", "check": "exact", "resave": True, "direct_psnr": 48},
+    {"name": "jpeg_copy", "input": "exif6.jpg", "do": [], "out": "out.jpg", "check": "exact", "same_scan": True},
+    {"name": "jpeg_orientation_only", "input": "exif6.jpg", "do": ["rotate 90 and flip h"],
+     "out": "out.jpg", "check": "exact", "same_scan": True},
+    {"name": "jpeg_insert_exif", "input": "plain.jpg", "do": ["rotate 90"],
+     "out": "out.jpg", "check": "exact", "same_scan": True},
+    {"name": "jpeg_exif_without_orientation", "input": "camera.jpg", "do": ["flip horizontal"],
+     "out": "out.jpg", "check": "exact", "same_scan": True},
+    {"name": "mpo_named_jpg", "input": "cam.jpg", "do": [], "out": "out.jpg", "check": "exact"},
+    {"name": "png_named_jpg", "input": "fake.jpg", "do": ["rotate 90"], "out": "out.jpg", "check": "exact"},
+    {"name": "lossless_webp", "input": "photo.png", "do": ["lossless webp"], "out": "out.webp", "check": "exact"},
+    {"name": "gif_frames", "input": "anim.gif", "do": ["rotate 90 and invert"], "out": "out.gif", "check": "exact"},
+    {"name": "tiff_pages", "input": "pages.tif", "do": ["bnw"], "out": "out.tif", "check": "exact"},
+    {"name": "target_bytes_jpeg", "input": "photo.png", "do": ["bnw", "compress to 12kb"], "out": "out.jpg",
+     "check": {"psnr": 28, "reference": ["bnw"], "max_bytes": 12 * 1024}},
+    {"name": "ssim_jpeg", "input": "photo.png", "do": ["quality ssim 0.95"], "out": "out.jpg",
+     "check": {"psnr": 30, "reference": []}},
+    {"name": "psnr_webp_option", "input": "photo.png", "do": ["ratio 1:1"], "out": "out.webp",
+     "save": ["--psnr", "38"], "check": {"psnr": 28, "reference": ["ratio 1:1"]}},
+    {"name": "smallest_jpeg", "input": "photo.png", "do": ["profile smallest", "blur 1"], "out": "out.jpg",
+     "check": {"psnr": 30, "reference": ["blur 1"]}},
+    {"name": "anim_webp", "input": "anim.gif", "do": ["rotate 90 and invert"], "out": "out.webp",
+     "check": {"psnr": 24, "reference": ["rotate 90 and invert"]}},
+    {"name": "anim_webp_once", "input": "once.gif", "do": ["invert"], "out": "out.webp",
+     "check": {"psnr": 24, "reference": ["invert"]}},
+]
+
+
+# ---------- synthetic inputs ----------
+
+def photo(w: int, h: int) -> Image.Image:
+    """Deterministic photo-like RGB image: fractal detail over colour gradients."""
+    detail = Image.effect_mandelbrot((w, h), (-2.0, -1.5, 1.0, 1.5), 100)
+    gradient = Image.linear_gradient("L")
+    return Image.merge("RGB", (detail, gradient.resize((w, h)),
+                               gradient.transpose(Image.Transpose.ROTATE_90).resize((w, h))))
+
+
+def textured_photo(w: int, h: int) -> Image.Image:
+    """Deterministic camera-like RGB image with fine texture that JPEG blocking disturbs."""
+    noise = Image.frombytes("L", (w, h), random.Random(0).randbytes(w * h)).filter(ImageFilter.GaussianBlur(1.2))
+    base = photo(w, h)
+    r, g, b = base.split()
+    return Image.merge("RGB", (Image.blend(r, noise, 0.5), Image.blend(g, noise, 0.4), b))
+
+
+def _frames(n: int, size=(96, 64)):
+    for i in range(n):
+        im = Image.new("RGB", size, (i * 40 % 256, 60, 200 - i * 20))
+        ImageDraw.Draw(im).ellipse((i * 10, 8, i * 10 + 30, 40), fill=(255, 220, 0))
+        yield im
+
+
+def make_inputs(root: Path) -> Path:
+    """Write every synthetic input into root and return it."""
+    root.mkdir(parents=True, exist_ok=True)
+    photo(320, 240).save(root / "photo.png")
+    # fine texture, so resizing from too small a pyramid level shows up as aliasing
+    textured_photo(1024, 768).save(root / "large.png")
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored sideways, displayed rotated 90 clockwise
+    photo(160, 120).save(root / "exif6.jpg", quality=90, exif=exif)
+    photo(160, 120).save(root / "plain.jpg", quality=90)  # JFIF only, no EXIF block
+    camera = Image.Exif()
+    camera[0x010F] = "minipil"  # Make, but no Orientation entry
+    photo(160, 120).save(root / "camera.jpg", quality=90, exif=camera)
+    # suffix says JPEG, header says otherwise: a two-image MPO and a PNG
+    photo(160, 120).save(root / "cam.jpg", format="MPO", save_all=True, append_images=[photo(80, 60)], quality=90)
+    photo(160, 120).save(root / "fake.jpg", format="PNG")
+
+    frames = list(_frames(6))
+    frames[0].save(root / "anim.gif", save_all=True, append_images=frames[1:],
+                   duration=[40, 60, 80, 100, 120, 140], loop=0)
+    # no loop argument: no NETSCAPE extension, so it plays once
+    frames[0].save(root / "once.gif", save_all=True, append_images=frames[1:4], duration=90)
+    frames[0].save(root / "pages.tif", save_all=True, append_images=frames[1:3])
+    return root
+
+
+# ---------- running the pipeline ----------
+
+@contextmanager
+def isolated_session(root: Path):
+    """Point the persisted session (and pyramid cache) at root for the duration."""
+    saved = (session._SESSION_DIR, session._SESSION_FILE, session._PYRAMID_DIR)
+    session._SESSION_DIR = root
+    session._SESSION_FILE = root / "session.json"
+    session._PYRAMID_DIR = root / "pyramid"
+    session.SESSION.clear()
+    try:
+        yield
+    finally:
+        session.SESSION.clear()
+        session._SESSION_DIR, session._SESSION_FILE, session._PYRAMID_DIR = saved
+        session.SESSION.__init__()
+
+
+def _invoke(runner: CliRunner, args):
+    result = runner.invoke(app, args)
+    if result.exit_code != 0:
+        raise RuntimeError(f"minipil {' '.join(args)} failed: {result.output.strip()}")
+    return result.output
+
+
+def run_pipeline(src: Path, instructions, out: Path, save_args=()) -> float:
+    """connect + do each instruction + save; returns seconds spent in do/save."""
+    runner = CliRunner()
+    with isolated_session(out.parent / ".session"):
+        _invoke(runner, ["connect", str(src)])
+        t0 = time.perf_counter()
+        for text in instructions:
+            _invoke(runner, ["do", text])
+        _invoke(runner, ["save", str(out), *save_args])
+        return time.perf_counter() - t0
+
+
+def decoded_frames(path: Path):
+    """[(RGB frame as displayed, duration)] for every frame of an output file."""
+    frames = []
+    with Image.open(path) as im:
+        for idx in range(getattr(im, "n_frames", 1)):
+            im.seek(idx)
+            frames.append((ImageOps.exif_transpose(im).convert("RGB"), im.info.get("duration", 0)))
+    return frames
+
+
+def playback_loop(path: Path):
+    """Loop count as played: 0 forever, n times, or 1 when the file has no loop (plays once)."""
+    with Image.open(path) as im:
+        if getattr(im, "n_frames", 1) < 2 or im.format == "TIFF":
+            return None
+        loop = im.info.get("loop")
+    return 1 if loop is None else loop
+
+
+def pixel_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    for frame, duration in decoded_frames(path):
+        h.update(f"{frame.size}:{duration};".encode())
+        h.update(frame.tobytes())
+    return h.hexdigest()
+
+
+def direct_render(src: Path, instructions) -> Image.Image:
+    """The edits replayed on the full-resolution input, bypassing the pyramid cache."""
+    with Image.open(src) as im:
+        img = ImageOps.exif_transpose(im).convert("RGB")
+    return apply_history(img, [parse_nl(text) for text in instructions])
+
+
+def jpeg_scan(path: Path) -> bytes:
+    """Entropy-coded data of a JPEG, from the first start-of-scan marker on."""
+    data = path.read_bytes()
+    return data[data.index(b"\xff\xda"):]
+
+
+def _psnr(a: Image.Image, b: Image.Image) -> float:
+    # RGB histogram is three 256-bin bands back to back
+    hist = ImageChops.difference(a, b).histogram()
+    mse = sum((i % 256) ** 2 * count for i, count in enumerate(hist)) / (a.size[0] * a.size[1] * 3)
+    return float("inf") if mse == 0 else 10 * math.log10(255 * 255 / mse)
+
+
+def run_case(case, inputs: Path, workdir: Path):
+    """Run one case; returns {"name", "seconds", "bytes", "input", "output", "resaved", "reference"}."""
+    workdir.mkdir(parents=True, exist_ok=True)
+    src = inputs / case["input"]
+    out = workdir / case["out"]
+    seconds = run_pipeline(src, case["do"], out, case.get("save", []))
+
+    # same workdir -> same session dir, so the second run hits the pyramid cache
+    resaved = None
+    if case.get("resave"):
+        resaved = workdir / f"resaved_{case['out']}"
+        run_pipeline(src, case["do"], resaved, case.get("save", []))
+
+    reference = None
+    if isinstance(case["check"], dict):
+        with Image.open(src) as im:
+            multi = getattr(im, "n_frames", 1) > 1
+        reference = workdir / ("reference.tif" if multi else "reference.png")
+        run_pipeline(src, case["check"]["reference"], reference)
+    return {"name": case["name"], "seconds": seconds, "bytes": out.stat().st_size,
+            "input": src, "output": out, "resaved": resaved, "reference": reference}
+
+
+def check_case(case, result, goldens):
+    """List of failure messages (empty when the case passes)."""
+    failures = []
+    check = case["check"]
+    if result.get("resaved") and pixel_hash(result["resaved"]) != pixel_hash(result["output"]):
+        failures.append("second save (cached pyramid) differs from the first")
+    if case.get("direct_psnr"):
+        got = decoded_frames(result["output"])[0][0]
+        want = direct_render(result["input"], case["do"])
+        score = _psnr(got, want) if got.size == want.size else 0.0
+        if score < case["direct_psnr"]:
+            failures.append(f"PSNR {score:.2f} dB vs full-resolution edits < {case['direct_psnr']} dB")
+    if playback_loop(result["output"]) not in (None, playback_loop(result["input"])):
+        failures.append(f"loop {playback_loop(result['output'])} != input {playback_loop(result['input'])}")
+    if case.get("same_scan") and jpeg_scan(result["output"]) != jpeg_scan(result["input"]):
+        failures.append("JPEG scan data was re-encoded instead of copied")
+
+    if check == "exact":
+        expected = goldens.get("hashes", {}).get(case["name"])
+        actual = pixel_hash(result["output"])
+        if expected is None:
+            failures.append(f"no golden hash recorded (run python -m tests.golden --update); got {actual}")
+        elif expected != actual:
+            failures.append(f"pixel hash {actual} != golden {expected}")
+        return failures
+
+    got = decoded_frames(result["output"])
+    want = decoded_frames(result["reference"])
+    if len(got) != len(want):
+        return [f"{len(got)} frames, reference has {len(want)}"]
+    # timing must survive from the input (the lossless reference may be a TIFF)
+    durations = [d for _, d in decoded_frames(result["input"])] if len(got) > 1 else [d for _, d in got]
+    for idx, ((g, gd), (w, _)) in enumerate(zip(got, want)):
+        if g.size != w.size:
+            failures.append(f"frame {idx}: size {g.size} != reference {w.size}")
+            continue
+        score = _psnr(g, w)
+        if score < check["psnr"]:
+            failures.append(f"frame {idx}: PSNR {score:.2f} dB < {check['psnr']} dB")
+        if gd != durations[idx]:
+            failures.append(f"frame {idx}: duration {gd} != input {durations[idx]}")
+    if check.get("max_bytes") and result["bytes"] > check["max_bytes"]:
+        failures.append(f"{result['bytes']} bytes > target {check['max_bytes']}")
+    return failures
+
+
+def load_goldens():
+    if not GOLDEN_FILE.exists():
+        return {}
+    return json.loads(GOLDEN_FILE.read_text(encoding="utf-8"))
+
+
+def goldens_apply(goldens) -> bool:
+    """Exact hashes are only comparable on the Pillow major version they were recorded with."""
+    recorded = goldens.get("pillow", "")
+    return recorded.split(".")[0] == PIL.__version__.split(".")[0]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="minipil golden-image harness")
+    parser.add_argument("--update", action="store_true", help="re-record golden hashes for exact cases")
+    parser.add_argument("--timings", help="write one JSON line per case to this file")
+    args = parser.parse_args(argv)
+
+    goldens = load_goldens()
+    if not args.update and goldens and not goldens_apply(goldens):
+        print(f"golden hashes were recorded with Pillow {goldens['pillow']}, running {PIL.__version__}; "
+              "exact cases will likely differ")
+
+    results, failed = [], 0
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs = make_inputs(Path(tmp) / "inputs")
+        hashes = {}
+        for case in CASES:
+            result = run_case(case, inputs, Path(tmp) / case["name"])
+            if args.update and case["check"] == "exact":
+                hashes[case["name"]] = pixel_hash(result["output"])
+                failures = []
+            else:
+                failures = check_case(case, result, goldens)
+            failed += bool(failures)
+            status = "FAIL" if failures else "ok"
+            print(f"{case['name']:<24} {status:<5} {result['bytes']:>9} B {result['seconds'] * 1000:>9.1f} ms")
+            for msg in failures:
+                print(f"    {msg}")
+            results.append({"case": case["name"], "ok": not failures,
+                            "bytes": result["bytes"], "seconds": round(result["seconds"], 4)})
+
+    if args.update:
+        GOLDEN_FILE.write_text(json.dumps({"pillow": PIL.__version__, "hashes": hashes}, indent=2) + "\n",
+                               encoding="utf-8")
+        print(f"recorded {len(hashes)} golden hashes -> {GOLDEN_FILE}")
+    if args.timings:
+        with open(args.timings, "w", encoding="utf-8") as f:
+            for row in results:
+                f.write(json.dumps(row) + "\n")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
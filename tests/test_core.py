@@ -0,0 +1,156 @@
+# test_core.py
+# Focused checks on minipil.core behaviour the golden cases cannot see from output pixels alone.
+import io
+import json
+
+import pytest
+from PIL import Image, ImageFile
+from typer.testing import CliRunner
+
+from minipil import core, session
+from minipil.cli import app
+from minipil.core import (compress_to_target_quality, encoder_options, save_frames, _encode_at_quality, _ssim,
+                          _ssim_stats)
+
+from . import golden
+
+
+def test_ssim_target_on_large_detailed_image_does_not_collapse_to_min_q():
+    img = golden.textured_photo(3184, 2128)
+    data = compress_to_target_quality(img, "jpeg", "ssim", 0.95)
+    floor = _encode_at_quality(img, "JPEG", 10, encoder_options("JPEG"))
+    assert len(data) > 2 * len(floor)
+
+    # scored at half resolution, the full-resolution result stays close to the target
+    ref = img.convert("L")
+    with Image.open(io.BytesIO(data)) as decoded:
+        assert _ssim(_ssim_stats(ref), decoded.convert("L")) > 0.9
+
+
+def test_save_frames_falls_back_to_save_all_without_streaming_internals(tmp_path, monkeypatch):
+    def unsupported(first, rest, out_path, **options):
+        raise core._StreamingUnsupported("WebPAnimEncoder.add() signature changed")
+
+    monkeypatch.setattr(core, "_write_webp_frames", unsupported)
+    # loop None (a GIF that plays once) must not become WebP's loop-forever 0
+    for loop, expected in ((2, 2), (None, 1)):
+        frames = [(im, {"duration": 80, "loop": loop}) for im in golden._frames(4)]
+        out = tmp_path / "anim.webp"
+        save_frames(iter(frames), str(out), profile="lossless")
+        with Image.open(out) as im:
+            assert im.n_frames == 4
+            assert im.info.get("loop") == expected
+
+
+def test_save_with_target_warns_that_frames_are_dropped(tmp_path):
+    src = tmp_path / "anim.gif"
+    first, *rest = golden._frames(3)
+    first.save(src, save_all=True, append_images=rest, duration=80, loop=0)
+    runner = CliRunner()
+    with golden.isolated_session(tmp_path / ".session"):
+        golden._invoke(runner, ["connect", str(src)])
+        output = golden._invoke(runner, ["save", str(tmp_path / "out.gif"), "--psnr", "30"])
+    assert "writing first frame only" in output
+
+
+def test_pyramid_cache_evicts_least_recently_used_and_clear_removes_it(tmp_path, monkeypatch):
+    for name in ("a.png", "b.png"):
+        golden.photo(1024, 768).rotate(90 if name == "b.png" else 0).save(tmp_path / name)
+    root = tmp_path / ".session"
+    with golden.isolated_session(root):
+        monkeypatch.setattr(session, "_PYRAMID_MAX_BYTES", 1)
+        pyramids = root / "pyramid"
+        session.SESSION.connect(tmp_path / "a.png")
+        session.SESSION.load_pyramid_level((100, 75))
+        first = list(pyramids.iterdir())
+        assert len(first) == 1 and not list(first[0].glob("*.tmp"))
+
+        # over budget: the older pyramid goes, the one in use stays
+        session.SESSION.connect(tmp_path / "b.png")
+        session.SESSION.load_pyramid_level((100, 75))
+        remaining = list(pyramids.iterdir())
+        assert len(remaining) == 1 and remaining != first
+        assert sorted(f.name for f in remaining[0].iterdir()) == ["1.png", "2.png", "3.png"]
+
+        session.SESSION.clear()
+        assert not pyramids.exists()
+
+
+def test_lossless_profile_rejects_jpeg(tmp_path):
+    with pytest.raises(ValueError, match="JPEG has no lossless mode"):
+        encoder_options("jpg", "lossless")
+    golden.photo(64, 48).save(tmp_path / "in.png")
+    runner = CliRunner()
+    with golden.isolated_session(tmp_path / ".session"):
+        golden._invoke(runner, ["connect", str(tmp_path / "in.png")])
+        result = runner.invoke(app, ["do", "lossless jpg"])
+        assert result.exit_code == 1 and "JPEG has no lossless mode" in result.output
+        assert session.SESSION._actions_history == []
+
+
+def _oriented_png(inputs):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    golden.photo(160, 120).save(inputs / "exif6.png", exif=exif)
+    return inputs
+
+
+def test_info_prints_oriented_header_fields_and_fails_on_bad_files(tmp_path):
+    inputs = _oriented_png(golden.make_inputs(tmp_path / "inputs"))
+    (tmp_path / "notes.txt").write_text("not an image")
+    files = [inputs / "exif6.jpg", inputs / "anim.gif", inputs / "photo.png", inputs / "exif6.png",
+             tmp_path / "notes.txt"]
+    result = CliRunner().invoke(app, ["info", *map(str, files)])
+    assert result.exit_code == 1
+    jpg, gif, png, oriented_png, bad = [json.loads(line) for line in result.output.splitlines()]
+    assert jpg == {"path": str(files[0]), "width": 120, "height": 160, "mode": "RGB", "format": "JPEG",
+                   "frames": 1, "bytes": files[0].stat().st_size}
+    assert (gif["format"], gif["frames"], gif["width"], gif["height"]) == ("GIF", 6, 96, 64)
+    assert (png["format"], png["width"], png["height"]) == ("PNG", 320, 240)
+    assert (oriented_png["width"], oriented_png["height"]) == (120, 160)
+    assert bad["path"] == str(files[4]) and "error" in bad
+
+
+def test_connect_reads_the_header_only(tmp_path, monkeypatch):
+    inputs = _oriented_png(golden.make_inputs(tmp_path / "inputs"))
+
+    def no_decode(self):
+        raise AssertionError("connect decoded pixels")
+
+    monkeypatch.setattr(ImageFile.ImageFile, "load", no_decode)
+    runner = CliRunner()
+    with golden.isolated_session(tmp_path / ".session"):
+        output = golden._invoke(runner, ["connect", str(inputs / "exif6.jpg")])
+        assert output.strip() == "Connected to: exif6.jpg (120x160, format=JPEG)"
+        output = golden._invoke(runner, ["connect", str(inputs / "anim.gif")])
+        assert output.strip() == "Connected to: anim.gif (96x64, format=GIF, frames=6)"
+        output = golden._invoke(runner, ["connect", str(inputs / "photo.png")])
+        assert output.strip() == "Connected to: photo.png (320x240, format=PNG)"
+        output = golden._invoke(runner, ["connect", str(inputs / "exif6.png")])
+        assert output.strip() == "Connected to: exif6.png (120x160, format=PNG)"
+        assert session.SESSION.img is None
+
+
+def test_warm_pyramid_save_does_not_decode_the_png_master(tmp_path, monkeypatch):
+    master = tmp_path / "master.png"
+    golden.photo(1024, 768).save(master)
+    decoded = []
+    load = ImageFile.ImageFile.load
+
+    def spy(self):
+        if self.size == (1024, 768):
+            decoded.append(self.format)
+        return load(self)
+
+    monkeypatch.setattr(ImageFile.ImageFile, "load", spy)
+    runner = CliRunner()
+    with golden.isolated_session(tmp_path / ".session"):
+        golden._invoke(runner, ["connect", str(master)])
+        golden._invoke(runner, ["do", "width 200"])
+        golden._invoke(runner, ["save", str(tmp_path / "cold.png")])  # builds the pyramid
+
+        # save already probed the master; the pyramid lookup must not read it again
+        decoded.clear()
+        monkeypatch.setattr(session, "probe_image", None)
+        golden._invoke(runner, ["save", str(tmp_path / "warm.png")])
+        assert decoded == []
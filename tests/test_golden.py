@@ -0,0 +1,24 @@
+# test_golden.py
+# pytest entry point for the golden-image harness in golden.py.
+import pytest
+
+from . import golden
+
+GOLDENS = golden.load_goldens()
+
+
+@pytest.fixture(scope="module")
+def inputs(tmp_path_factory):
+    return golden.make_inputs(tmp_path_factory.mktemp("inputs"))
+
+
+@pytest.mark.parametrize("case", golden.CASES, ids=[c["name"] for c in golden.CASES])
+def test_golden(case, inputs, tmp_path, record_property):
+    if case["check"] == "exact" and not golden.goldens_apply(GOLDENS):
+        pytest.skip(f"golden hashes recorded with Pillow {GOLDENS.get('pillow')}; "
+                    "re-record with python -m tests.golden --update")
+    result = golden.run_case(case, inputs, tmp_path)
+    record_property("seconds", round(result["seconds"], 4))
+    record_property("bytes", result["bytes"])
+    failures = golden.check_case(case, result, GOLDENS)
+    assert not failures, "\n".join(failures)
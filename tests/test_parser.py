@@ -0,0 +1,17 @@
+# test_parser.py
+# Phrases where one parser rule could swallow another's clause.
+import pytest
+
+from minipil.parser import parse_nl
+
+
+@pytest.mark.parametrize("text, expected", [
+    # "smallest file" is a size request, not the smallest encoder profile
+    ("smallest file size 200kb", {"target_bytes": 200 * 1024}),
+    ("profile smallest size 200kb", {"profile": "smallest", "target_bytes": 200 * 1024}),
+    ("lossless webp", {"profile": "lossless", "format": "webp"}),
+    ("fast encode and 150kb", {"profile": "fast", "target_bytes": 150 * 1024}),
+    ("quality ssim 0.95", {"target_quality": ("ssim", 0.95)}),
+])
+def test_parse_nl(text, expected):
+    assert parse_nl(text) == expected